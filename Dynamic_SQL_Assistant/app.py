@@ -1,11 +1,7 @@
 import streamlit as st
 import pandas as pd
-import os
-import tempfile
-from io import StringIO
-import urllib.request
-from utils.database import create_database_from_csv, execute_query, clean_column_name
-from utils.llm_service import get_sql_query
+from utils.database import load_csv, load_csv_from_url, create_database_from_csv, build_schema_strings, schema_dtypes, execute_query, clean_column_names
+from utils.llm_service import get_sql_query, get_sql_queries
 
 # Page configuration
 st.set_page_config(
@@ -32,11 +28,9 @@ with st.sidebar:
         uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
         if uploaded_file is not None:
             try:
-                df = pd.read_csv(uploaded_file)
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-                    tmp.write(uploaded_file.getvalue())
-                    temp_path = tmp.name
-                db_conn = create_database_from_csv(temp_path, table_name)
+                csv_bytes = uploaded_file.getvalue()
+                df = load_csv(csv_bytes)
+                db_conn = create_database_from_csv(csv_bytes, table_name, _df=df)
                 st.success(f"Successfully loaded CSV with {df.shape[0]} rows and {df.shape[1]} columns.")
             except Exception as e:
                 st.error(f"Error loading CSV: {e}")
@@ -44,68 +38,90 @@ with st.sidebar:
         url = st.text_input("Enter the URL of a CSV file:")
         if url:
             try:
-                with urllib.request.urlopen(url) as response:
-                    csv_data = response.read().decode('utf-8')
-                    df = pd.read_csv(StringIO(csv_data))
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp:
-                        tmp.write(csv_data.encode())
-                        temp_path = tmp.name
-                    db_conn = create_database_from_csv(temp_path, table_name)
-                    st.success(f"Successfully loaded CSV with {df.shape[0]} rows and {df.shape[1]} columns.")
+                df = load_csv_from_url(url)
+                db_conn = create_database_from_csv(url, table_name, _df=df)
+                st.success(f"Successfully loaded CSV with {df.shape[0]} rows and {df.shape[1]} columns.")
             except Exception as e:
                 st.error(f"Error loading CSV from URL: {e}")
     
     # Display database schema if data is loaded
     if df is not None:
         st.subheader("Database Schema")
-        schema_text = f"Table: {table_name}\n\nColumns:\n"
-        for col in df.columns:
-            dtype = str(df[col].dtype)
-            schema_text += f"- {col} ({dtype})\n"
+        schema_text, table_info = build_schema_strings(
+            table_name, tuple(df.columns), schema_dtypes(df)
+        )
         st.text(schema_text)
 
 
+def show_query_results(db_conn, sql_query, key=None):
+    """
+    Execute an SQL query and display its results with a download button
+    
+    Args:
+        db_conn (sqlite3.Connection): Database connection
+        sql_query (str): SQL query to execute
+        key (str): Widget key, needed when several results are shown at once
+    """
+    # Executing the query
+    with st.spinner("Executing query..."):
+        try:
+            result_df = execute_query(db_conn, sql_query)
+            
+            # Display results
+            st.subheader("Query Results")
+            st.dataframe(result_df, use_container_width=True)
+            
+            # Add download button for results
+            csv = result_df.to_csv(index=False)
+            st.download_button(
+                label="Download Results as CSV",
+                data=csv,
+                file_name="query_results.csv",
+                mime="text/csv",
+                key=key
+            )
+        except Exception as e:
+            st.error(f"Error executing query: {e}")
+
+
 # Main area for query input and results
 if 'df' in locals() and df is not None:
     st.header("Ask Questions About Your Data")
     
     # Query input
-    query = st.text_area("Enter your question in plain English:", height=100)
+    query = st.text_area(
+        "Enter your question in plain English (one per line to ask several at once):",
+        height=100
+    )
     
     col1, col2 = st.columns([1, 3])
     with col1:
         if st.button("Generate SQL & Execute", type="primary"):
-            if query:
-                with st.spinner("Generating SQL query..."):
-                    # Get table info for context
-                    table_info = "\n".join([f"- {col} ({df[col].dtype})" for col in df.columns])
-                    
-                    # Generate SQL from natural language
-                    sql_query = get_sql_query(query, table_name, table_info)
-                    
-                    # Display the generated SQL
-                    st.subheader("Generated SQL Query")
+            questions = [line.strip() for line in query.splitlines() if line.strip()]
+            if len(questions) > 1:
+                # Several questions: generate all of them with a single LLM request
+                with st.spinner("Generating SQL queries..."):
+                    sql_queries = get_sql_queries(tuple(questions), table_name, table_info)
+                
+                for i, (question, sql_query) in enumerate(zip(questions, sql_queries), 1):
+                    st.subheader(f"Question {i}: {question}")
                     st.code(sql_query, language="sql")
-                    
-                    # Executing the query
-                    with st.spinner("Executing query..."):
-                        try:
-                            result_df = execute_query(db_conn, sql_query)
-                            
-                            # Display results
-                            st.subheader("Query Results")
-                            st.dataframe(result_df, use_container_width=True)
-                            
-                            # Add download button for results
-                            csv = result_df.to_csv(index=False)
-                            st.download_button(
-                                label="Download Results as CSV",
-                                data=csv,
-                                file_name="query_results.csv",
-                                mime="text/csv"
-                            )
-                        except Exception as e:
-                            st.error(f"Error executing query: {e}")
+                    show_query_results(db_conn, sql_query, key=f"download_{i}")
+            elif questions:
+                st.subheader("Generated SQL Query")
+                sql_placeholder = st.empty()
+                
+                # Generate SQL from natural language, streaming the tokens as they
+                # arrive; repeated questions are served from the cache instead
+                with sql_placeholder:
+                    sql_query = get_sql_query(
+                        query, table_name, table_info, _write_stream=st.write_stream
+                    )
+                
+                # Replace the streamed response with the extracted SQL
+                sql_placeholder.code(sql_query, language="sql")
+                
+                show_query_results(db_conn, sql_query)
             else:
                 st.warning("Please enter a question first.")
     
@@ -126,7 +142,7 @@ if 'df' in locals() and df is not None:
         display_df = df.copy()
         
         # Process column names the same way they're processed for the database
-        processed_columns = [clean_column_name(col) for col in df.columns]
+        processed_columns = clean_column_names(df.columns)
         
         # Create a mapping from original to processed column names
         column_mapping = {original: processed for original, processed in zip(df.columns, processed_columns)}
@@ -175,15 +191,3 @@ st.markdown(
     "Built with Streamlit, SQLite, LangChain, and Groq Llama 3 | "
     "[GitHub Repository](https://github.com/yourusername/dynamic-sql-assistant)"
 )
-
-# Clean up temporary files when the app is closed
-def cleanup():
-    if 'temp_path' in locals():
-        try:
-            os.unlink(temp_path)
-        except:
-            pass
-
-# Register the cleanup function
-import atexit
-atexit.register(cleanup)
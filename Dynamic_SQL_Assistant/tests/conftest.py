@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app imports its helpers as `utils.*` relative to the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,65 @@
+from utils.llm_service import extract_sql_from_response, extract_sql_queries_from_response
+
+
+def test_sql_in_a_fenced_block():
+    response = "Here you go:\n```sql\nSELECT 1;\n```\nThis counts rows."
+
+    assert extract_sql_from_response(response) == "SELECT 1;"
+
+
+def test_sql_in_a_bare_fenced_block():
+    response = "```\nSELECT COUNT(*) FROM data;\n```"
+
+    assert extract_sql_from_response(response) == "SELECT COUNT(*) FROM data;"
+
+
+def test_prose_before_a_bare_statement_is_dropped():
+    response = "Here is the query with the count:\nSELECT COUNT(*) FROM data;"
+
+    assert extract_sql_from_response(response) == "SELECT COUNT(*) FROM data;"
+
+
+def test_statement_starting_with_a_cte():
+    response = "WITH x AS (SELECT 1) SELECT * FROM x"
+
+    assert extract_sql_from_response(response) == response
+
+
+def test_response_without_sql_is_returned_as_is():
+    assert extract_sql_from_response("  I can't answer that.  ") == "I can't answer that."
+
+
+def test_batched_queries_on_marker_lines():
+    response = "-- Q1: SELECT COUNT(*) FROM data;\n-- Q2: SELECT MAX(age) FROM data;"
+
+    assert extract_sql_queries_from_response(response, 2) == [
+        "SELECT COUNT(*) FROM data;",
+        "SELECT MAX(age) FROM data;",
+    ]
+
+
+def test_batched_queries_below_marker_lines():
+    response = "-- Q1:\nSELECT COUNT(*) FROM data;\n\n-- Q2:\nSELECT MAX(age) FROM data;\n"
+
+    assert extract_sql_queries_from_response(response, 2) == [
+        "SELECT COUNT(*) FROM data;",
+        "SELECT MAX(age) FROM data;",
+    ]
+
+
+def test_batched_queries_in_a_single_code_fence():
+    response = "```sql\n-- Q1:\nSELECT 1;\n-- Q2:\nSELECT 2;\n```"
+
+    assert extract_sql_queries_from_response(response, 2) == ["SELECT 1;", "SELECT 2;"]
+
+
+def test_batched_queries_in_separate_code_fences():
+    response = "-- Q1:\n```sql\nSELECT 1;\n```\n-- Q2:\n```sql\nSELECT 2;\n```"
+
+    assert extract_sql_queries_from_response(response, 2) == ["SELECT 1;", "SELECT 2;"]
+
+
+def test_unanswered_questions_are_empty():
+    response = "-- Q1: SELECT 1;\n-- Q5: SELECT 5;"
+
+    assert extract_sql_queries_from_response(response, 3) == ["SELECT 1;", "", ""]
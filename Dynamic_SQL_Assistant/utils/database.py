@@ -1,32 +1,335 @@
+import datetime
+import difflib
+import io
+import os
+import re
 import sqlite3
+import uuid
 import pandas as pd
-import os
+import streamlit as st
+
+# Characters that are not allowed in SQL-friendly column names
+_INVALID_CHARS = re.compile(r'\W')
+
+# Text columns with fewer distinct values than this share of rows become categoricals
+_CATEGORY_MAX_DISTINCT_RATIO = 0.5
+
+# Tables with more rows than this get indexes on their low-cardinality columns
+_INDEX_MIN_ROWS = 10_000
+_INDEX_MAX_DISTINCT_RATIO = 0.5
+
+# Quoted identifiers in generated SQL, and the column named in SQLite errors
+_QUOTED_IDENTIFIER = re.compile(r'"([^"]+)"|`([^`]+)`')
+_NO_SUCH_COLUMN = re.compile(r'no such column: (.+?)\s*$', re.IGNORECASE)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=16)
+def load_csv(csv_bytes):
+    """
+    Parse raw CSV bytes into a dataframe (cached on the file contents)
+    
+    Args:
+        csv_bytes (bytes): Raw contents of the CSV file
+        
+    Returns:
+        pd.DataFrame: Parsed dataframe
+    """
+    return _read_csv(csv_bytes)
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=16)
+def load_csv_from_url(url):
+    """
+    Download and parse a CSV file into a dataframe (cached per URL)
+    
+    Only the dataframe is cached; the downloaded bytes are dropped after parsing.
+    
+    Args:
+        url (str): http(s) URL of the CSV file
+        
+    Returns:
+        pd.DataFrame: Parsed dataframe
+    """
+    # Only needed for URL sources, so keep it off the import path
+    import urllib.parse
+    import urllib.request
+    
+    # pd.read_csv would also open local paths, so restrict this to web URLs
+    if urllib.parse.urlparse(url).scheme not in ('http', 'https'):
+        raise ValueError("Only http:// and https:// URLs are supported")
+    
+    # Download once, so falling back to the C engine doesn't fetch the file again
+    with urllib.request.urlopen(url) as response:
+        csv_bytes = response.read()
+    
+    return _read_csv(csv_bytes)
+
+def _read_csv(csv_bytes):
+    """
+    Parse raw CSV bytes and shrink the resulting dtypes
+    
+    Args:
+        csv_bytes (bytes): Raw contents of the CSV file
+        
+    Returns:
+        pd.DataFrame: Parsed dataframe
+    """
+    # The multithreaded Arrow parser is much faster on larger files; fall back to
+    # the default C engine if pyarrow is missing, rejects the file, or parses it
+    # differently from pandas
+    try:
+        df = pd.read_csv(io.BytesIO(csv_bytes), engine='pyarrow')
+    except (ImportError, ValueError):
+        df = None
+    
+    if df is None or _needs_c_engine(df):
+        df = pd.read_csv(io.BytesIO(csv_bytes))
+    
+    return _shrink_dtypes(df)
 
-def create_database_from_csv(csv_path, table_name="data"):
+def _needs_c_engine(df):
     """
-    Create an SQLite database from a CSV file
+    Check whether a pyarrow-parsed dataframe differs from what pandas would give
+    
+    pyarrow skips pandas' header handling, so duplicate headers stay duplicated
+    (instead of "a", "a.1") and blank headers stay empty (instead of
+    "Unnamed: 0"). It also converts timezone-aware timestamps to UTC, which
+    would no longer match the text in the file.
     
     Args:
-        csv_path (str): Path to the CSV file
+        df (pd.DataFrame): Dataframe parsed with the pyarrow engine
+        
+    Returns:
+        bool: True if the file should be re-parsed with the C engine
+    """
+    columns = df.columns.astype(str)
+    return (
+        columns.duplicated().any()
+        or (columns == "").any()
+        or any(isinstance(dtype, pd.DatetimeTZDtype) for dtype in df.dtypes)
+    )
+
+def _shrink_dtypes(df):
+    """
+    Reduce the memory footprint of a freshly parsed dataframe without losing data
+    
+    Integer columns are downcast to the smallest integer type that fits, and
+    text columns with many repeated values become categoricals.
+    
+    Args:
+        df (pd.DataFrame): Parsed dataframe
+        
+    Returns:
+        pd.DataFrame: Dataframe with smaller dtypes
+    """
+    for col in df.select_dtypes('integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if df[col].nunique() < len(df) * _CATEGORY_MAX_DISTINCT_RATIO:
+            df[col] = df[col].astype('category')
+    
+    return df
+
+def schema_dtypes(df):
+    """
+    Describe column dtypes for the schema, hiding memory-saving representations
+    
+    Args:
+        df (pd.DataFrame): Dataframe returned by load_csv
+        
+    Returns:
+        tuple: Dtype names as parsed, before downcasting and categorical encoding
+    """
+    return tuple(_schema_dtype(dtype) for dtype in df.dtypes)
+
+def _schema_dtype(dtype):
+    """
+    Undo the representation changes made by _shrink_dtypes for one dtype
+    
+    Args:
+        dtype: Pandas dtype of the column
+        
+    Returns:
+        str: Dtype name the column had when parsed
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return str(dtype.categories.dtype)
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int64"
+    return str(dtype)
+
+class _Connection(sqlite3.Connection):
+    """
+    SQLite connection with a unique cache key and a per-connection column cache
+    
+    id() values are reused once an evicted connection is garbage collected, so
+    they can't safely key cached query results.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = uuid.uuid4().hex
+        self.table_columns = {}
+
+@st.cache_resource(show_spinner=False, ttl=3600, max_entries=16)
+def create_database_from_csv(source, table_name="data", _df=None):
+    """
+    Create an SQLite database from CSV data
+    
+    The connection is cached on the exact source (the file contents or its URL),
+    so it is only rebuilt when a different file is loaded. The parsed dataframe
+    is deliberately not part of the key: Streamlit only samples rows when hashing
+    large dataframes, so an edited file could get the old database back.
+    
+    Args:
+        source (bytes | str): Raw CSV contents, or the URL they were loaded from
         table_name (str): Name of the table to create
+        _df (pd.DataFrame): Dataframe already parsed from the source, if any
         
     Returns:
         sqlite3.Connection: Database connection object
     """
-    # Create an in-memory SQLite database
-    conn = sqlite3.connect(':memory:')
+    # Create an in-memory SQLite database; the cached connection is shared
+    # between Streamlit script threads
+    conn = sqlite3.connect(':memory:', check_same_thread=False, factory=_Connection)
+    
+    # Reuse the caller's dataframe instead of parsing the CSV a second time
+    if _df is not None:
+        df = _df
+    elif isinstance(source, bytes):
+        df = load_csv(source)
+    else:
+        df = load_csv_from_url(source)
+    
+    # Clean column names (replace spaces with underscores, remove special characters);
+    # set_axis returns a new frame so the caller's column names are left untouched
+    df = df.set_axis(clean_column_names(df.columns), axis=1)
+    
+    # The database only lives for this session, so skip journaling and syncing
+    # during the bulk load
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    
+    # Build the table definition from the dataframe dtypes
+    column_defs = ", ".join(f'"{col}" {_sqlite_type(df[col].dtype)}' for col in df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
     
-    # Read the CSV file
-    df = pd.read_csv(csv_path)
+    # Insert all rows in a single transaction, bypassing pandas' SQL layer
+    with conn:
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        conn.execute(f'CREATE TABLE "{table_name}" ({column_defs})')
+        conn.executemany(
+            f'INSERT INTO "{table_name}" VALUES ({placeholders})',
+            _temporal_to_text(df).itertuples(index=False, name=None)
+        )
     
-    # Clean column names (replace spaces with underscores, remove special characters)
-    df.columns = [clean_column_name(col) for col in df.columns]
+    # Index the columns the generated WHERE clauses are most likely to filter on
+    _create_indexes(conn, df, table_name)
     
-    # Write the dataframe to the SQLite table
-    df.to_sql(table_name, conn, index=False, if_exists='replace')
+    # From here on the workload is read-only analytics: let large sorts
+    # (ORDER BY, GROUP BY, DISTINCT) use worker threads, and reject writes so
+    # generated SQL can never modify the shared cached table
+    conn.execute(f"PRAGMA threads = {os.cpu_count() or 1}")
+    conn.execute("PRAGMA query_only = ON")
     
     return conn
 
+def _create_indexes(conn, df, table_name):
+    """
+    Index low-cardinality columns of large tables so filters avoid full scans
+    
+    Args:
+        conn (sqlite3.Connection): Database connection
+        df (pd.DataFrame): Dataframe the table was loaded from
+        table_name (str): Name of the table
+    """
+    # Small tables are scanned faster than an index can be built
+    if len(df) <= _INDEX_MIN_ROWS:
+        return
+    
+    with conn:
+        for col in df.columns:
+            if df[col].nunique() / len(df) < _INDEX_MAX_DISTINCT_RATIO:
+                conn.execute(f'CREATE INDEX "idx_{col}" ON "{table_name}" ("{col}")')
+        
+        # Collect statistics so the planner only uses the selective indexes
+        conn.execute("ANALYZE")
+
+def _temporal_to_text(df):
+    """
+    Convert timestamp, date and time columns to ISO strings for sqlite3
+    
+    The pyarrow parser infers these types, but sqlite3 can't bind them; as
+    text they behave like the rest of the TEXT columns.
+    
+    Args:
+        df (pd.DataFrame): Dataframe about to be inserted
+        
+    Returns:
+        pd.DataFrame: Dataframe with temporal values as ISO strings
+    """
+    temporal = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            temporal[col] = values.map(_iso_format).astype(object)
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            sample = values.dropna()
+            if len(sample) and isinstance(sample.iloc[0], (datetime.date, datetime.time)):
+                temporal[col] = values.astype(object).map(_iso_format)
+    
+    return df.assign(**temporal) if temporal else df
+
+def _iso_format(value):
+    """
+    Format a timestamp, date or time as an ISO string
+    
+    Args:
+        value: Temporal value, or a missing value
+        
+    Returns:
+        str: ISO formatted value, None if missing, other values unchanged
+    """
+    if pd.isna(value):
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+def _sqlite_type(dtype):
+    """
+    Map a pandas dtype to an SQLite column type
+    
+    Args:
+        dtype: Pandas dtype of the column
+        
+    Returns:
+        str: SQLite column type
+    """
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+@st.cache_data(show_spinner=False)
+def build_schema_strings(table_name, columns, dtypes):
+    """
+    Build the schema descriptions for the sidebar and the LLM prompt
+    
+    Args:
+        table_name (str): Name of the table
+        columns (tuple): Column names
+        dtypes (tuple): Column dtypes, as strings
+        
+    Returns:
+        tuple: (schema_text for display, table_info for the prompt)
+    """
+    table_info = "\n".join(f"- {col} ({dtype})" for col, dtype in zip(columns, dtypes))
+    schema_text = f"Table: {table_name}\n\nColumns:\n{table_info}\n"
+    return schema_text, table_info
+
 def clean_column_name(name):
     """
     Clean column names to be SQL-friendly
@@ -37,21 +340,42 @@ def clean_column_name(name):
     Returns:
         str: Cleaned column name
     """
-    # Replace spaces with underscores
-    clean_name = name.replace(' ', '_')
-    
-    # Remove special characters except underscores
-    clean_name = ''.join(c if c.isalnum() or c == '_' else '_' for c in clean_name)
+    # Replace spaces and special characters with underscores
+    clean_name = _INVALID_CHARS.sub('_', name)
     
     # Ensure the name doesn't start with a number
-    if clean_name[0].isdigit():
+    if clean_name[:1].isdecimal():
         clean_name = 'col_' + clean_name
     
     return clean_name.lower()
 
+def clean_column_names(columns):
+    """
+    Clean a whole set of column names in one vectorized pass
+    
+    Args:
+        columns (pd.Index): Original column names
+        
+    Returns:
+        list: Cleaned column names, in the same order
+    """
+    return (
+        pd.Index(columns).astype(str)
+        .str.replace(_INVALID_CHARS, '_', regex=True)
+        .str.replace(r'^(?=\d)', 'col_', regex=True)
+        .str.lower()
+        .tolist()
+    )
+
+@st.cache_data(
+    show_spinner=False,
+    ttl=3600,
+    max_entries=256,
+    hash_funcs={_Connection: lambda conn: conn.cache_key}
+)
 def execute_query(conn, query):
     """
-    Execute an SQL query on the database
+    Execute an SQL query on the database (cached per connection and query)
     
     Args:
         conn (sqlite3.Connection): Database connection
@@ -60,67 +384,148 @@ def execute_query(conn, query):
     Returns:
         pd.DataFrame: Query results as a dataframe
     """
+    # Map the identifiers in the query onto the real schema before running it,
+    # so wrongly quoted or cased column names don't cost a failed execution
+    actual_columns = _table_columns(conn)
+    query = _resolve_columns(query, actual_columns)
+    
     try:
         # Execute the query and return results as a dataframe
         return pd.read_sql_query(query, conn)
     except Exception as e:
-        # If there's an error, try to fix common issues
-        error_str = str(e).lower()
-        
-        if "no such column" in error_str:
-            # Get the actual column names from the database
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM pragma_table_info('data')")
-            actual_columns = [row[0] for row in cursor.fetchall()]
-            
-            # Try different quoting styles
-            # First attempt: Try with backticks
-            modified_query = query.replace('"', '`')
+        error = e
+    
+    # Queries sqlglot couldn't parse fall back to a single regex-based rewrite
+    # of the column names, then one more attempt
+    if "no such column" in str(error).lower():
+        modified_query = _rewrite_columns(query, actual_columns, str(error))
+        if modified_query != query:
             try:
                 return pd.read_sql_query(modified_query, conn)
-            except:
-                pass
-                
-            # Second attempt: Try without quotes
-            for col in actual_columns:
-                if ' ' in col:
-                    # If column has spaces, try using the cleaned version
-                    clean_col = clean_column_name(col)
-                    modified_query = query.replace(f'"{col}"', clean_col)
-                    try:
-                        return pd.read_sql_query(modified_query, conn)
-                    except:
-                        pass
-            
-            # Third attempt: Try each column from the database
-            for col in actual_columns:
-                if "raw" in col.lower() and "predict" in col.lower():
-                    # This might be the column we're looking for
-                    modified_query = query.replace('"raw predicted"', f'"{col}"')
-                    try:
-                        return pd.read_sql_query(modified_query, conn)
-                    except:
-                        pass
-        
-        # If we couldn't fix it or it's another type of error, re-raise
-        raise Exception(f"Query error: {e}\n\nAvailable columns: {', '.join(actual_columns)}")
-
-
-def find_closest_column(problem_col, actual_columns):
+            except Exception as e:
+                error = e
+    
+    # If we couldn't fix it or it's another type of error, re-raise
+    raise Exception(f"Query error: {error}\n\nAvailable columns: {', '.join(actual_columns)}")
+
+def _table_columns(conn, table_name="data"):
+    """
+    Get the column names of a table (cached on the connection)
+    
+    Args:
+        conn (_Connection): Database connection
+        table_name (str): Name of the table
+        
+    Returns:
+        tuple: Column names in table order
+    """
+    # Cached on the connection itself, so evicted databases aren't kept alive
+    if table_name not in conn.table_columns:
+        cursor = conn.execute("SELECT name FROM pragma_table_info(?)", (table_name,))
+        conn.table_columns[table_name] = tuple(row[0] for row in cursor.fetchall())
+    return conn.table_columns[table_name]
+
+def _resolve_columns(query, actual_columns):
+    """
+    Parse a query and point every column reference at a real column name
+    
+    Args:
+        query (str): Generated SQL query
+        actual_columns (tuple): Column names present in the table
+        
+    Returns:
+        str: Query with resolved column names, or the original query if it
+            could not be parsed or needed no changes
+    """
+    import sqlglot
+    from sqlglot import exp
+    
+    try:
+        tree = sqlglot.parse_one(query, read='sqlite')
+    except sqlglot.errors.SqlglotError:
+        return query
+    
+    # Reject writes up front rather than letting SQLite refuse them
+    if isinstance(tree, (exp.DML, exp.Create, exp.Drop, exp.Alter)):
+        raise Exception("Query error: only SELECT queries are supported")
+    if not isinstance(tree, exp.Query):
+        return query
+    
+    # Names the query defines itself must not be remapped onto table columns
+    aliases = {alias.alias for alias in tree.find_all(exp.Alias)}
+    
+    changed = False
+    for column in tree.find_all(exp.Column):
+        name = column.name
+        if name in actual_columns or name in aliases:
+            continue
+        # sqlglot parses double-quoted string values as columns too, so only
+        # equivalent names are safe to remap here; near misses are left for the
+        # "no such column" path, which knows which name SQLite rejected
+        match = find_closest_column(name, actual_columns, fuzzy=False)
+        if match:
+            column.set('this', exp.to_identifier(match, quoted=True))
+            changed = True
+    
+    return tree.sql(dialect='sqlite') if changed else query
+
+def _rewrite_columns(query, actual_columns, error_message):
+    """
+    Map the column identifiers in a query onto the real column names
+    
+    Quoted tokens are only remapped on an exact (case-insensitive or cleaned)
+    match, since SQLite also accepts double-quoted string values. Fuzzy matching
+    is reserved for the column SQLite actually reported as missing.
+    
+    Args:
+        query (str): SQL query that failed
+        actual_columns (tuple): Column names present in the table
+        error_message (str): SQLite error naming the missing column
+        
+    Returns:
+        str: Rewritten SQL query
+    """
+    def replace_quoted(match):
+        name = match.group(1) or match.group(2)
+        col = find_closest_column(name, actual_columns, fuzzy=False)
+        return f'"{col}"' if col else match.group(0)
+    
+    # Quoted identifiers, in either double quotes or backticks
+    query = _QUOTED_IDENTIFIER.sub(replace_quoted, query)
+    
+    # The column SQLite complained about, bare or in backticks
+    bad_column = _NO_SUCH_COLUMN.search(error_message)
+    if bad_column:
+        name = bad_column.group(1).split('.')[-1]
+        col = find_closest_column(name, actual_columns)
+        if col:
+            escaped = re.escape(name)
+            query = re.sub(rf'`{escaped}`|(?<![\w"`]){escaped}(?![\w"`])', f'"{col}"', query)
+    
+    return query
+
+
+def find_closest_column(problem_col, actual_columns, fuzzy=True):
     """
     Find the closest matching column name
     
     Args:
         problem_col (str): Problematic column name
         actual_columns (list): List of actual column names
+        fuzzy (bool): Fall back to similar, not just equivalent, names
         
     Returns:
         str: Closest matching column name or None
     """
-    # Simple case-insensitive match
-    for col in actual_columns:
-        if col.lower() == problem_col.lower():
-            return col
+    # Simple case-insensitive match, also against the cleaned form of the name
+    lowered = {col.lower(): col for col in actual_columns}
+    for candidate in (problem_col.lower(), clean_column_name(problem_col)):
+        if candidate in lowered:
+            return lowered[candidate]
+    
+    if not fuzzy:
+        return None
     
-    # If no exact match (ignoring case), return None
-    return None
+    # Otherwise fall back to the most similar column name
+    matches = difflib.get_close_matches(clean_column_name(problem_col), list(lowered), n=1, cutoff=0.6)
+    return lowered[matches[0]] if matches else None
@@ -1,12 +1,23 @@
+import re
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from utils.prompt_templates import SQL_GENERATION_TEMPLATE
+from utils.prompt_templates import SQL_GENERATION_TEMPLATE, BATCH_SQL_GENERATION_TEMPLATE
 
+# LangChain and the Groq client pull in hundreds of modules, so they are only
+# imported once a query is actually generated (see get_llm and get_chain)
+
+# SQL in a fenced code block, or a bare statement starting at the beginning of a line
+_SQL_CODE_BLOCK = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+_SQL_STATEMENT = re.compile(r"^\s*((?:SELECT|WITH)\b.*)", re.IGNORECASE | re.DOTALL | re.MULTILINE)
+
+# "-- Q<n>:" markers separating the answers in a batched response, and the
+# code fences a model may wrap around some or all of them
+_QUESTION_MARKER = re.compile(r"--[ \t]*Q(\d+)[ \t]*:", re.IGNORECASE)
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*")
+
+@st.cache_resource
 def get_llm():
     """
-    Initialize and return the LLM model
+    Initialize and return the LLM model (cached across reruns and sessions)
     
     Returns:
         ChatGroq: Initialized LLM model
@@ -16,6 +27,8 @@ def get_llm():
         st.error("GROQ_API_KEY not found in Streamlit secrets. Please add it to .streamlit/secrets.toml")
         st.stop()
     
+    from langchain_groq import ChatGroq
+    
     # Initialize the Groq LLM with Llama 3
     return ChatGroq(
         api_key=st.secrets["GROQ_API_KEY"],
@@ -24,42 +37,78 @@ def get_llm():
         max_tokens=1024
     )
 
-def get_sql_query(question, table_name, table_info):
+@st.cache_resource
+def get_chain(template=SQL_GENERATION_TEMPLATE):
+    """
+    Build the prompt | LLM | parser pipeline once and reuse it across calls
+    
+    Args:
+        template (str): Prompt template to build the chain for
+        
+    Returns:
+        Runnable: LCEL chain that maps prompt variables to the raw response text
+    """
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import PromptTemplate
+    
+    prompt = PromptTemplate.from_template(template)
+    return prompt | get_llm() | StrOutputParser()
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def get_sql_query(question, table_name, table_info, _write_stream=None):
     """
     Generate an SQL query from a natural language question
     
+    Results are cached per (question, table_name, table_info) so repeated
+    questions against the same schema skip the Groq round-trip, across sessions.
+    
     Args:
         question (str): Natural language question
         table_name (str): Name of the table to query
         table_info (str): Information about the table schema
+        _write_stream (callable): Optional renderer such as st.write_stream that
+            shows the response tokens as they arrive; not part of the cache key
         
     Returns:
         str: Generated SQL query
     """
-    # Initialize the LLM
-    llm = get_llm()
+    variables = {
+        "question": question,
+        "table_name": table_name,
+        "table_info": table_info
+    }
     
-    # Create prompt template
-    prompt = PromptTemplate(
-        template=SQL_GENERATION_TEMPLATE,
-        input_variables=["question", "table_name", "table_info"]
-    )
-    
-    # Create LLM chain
-    chain = LLMChain(llm=llm, prompt=prompt)
-    
-    # Generate SQL query
-    response = chain.run(
-        question=question,
-        table_name=table_name,
-        table_info=table_info
-    )
+    # Generate SQL query, streaming it to the page if a renderer was given
+    if _write_stream is None:
+        response = get_chain().invoke(variables)
+    else:
+        response = _write_stream(get_chain().stream(variables))
     
     # Extract the SQL query from the response
     # The model should return just the SQL, but we'll handle potential formatting issues
-    sql_query = extract_sql_from_response(response)
+    return extract_sql_from_response(response)
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def get_sql_queries(questions, table_name, table_info):
+    """
+    Generate SQL queries for several questions with a single LLM request
     
-    return sql_query
+    Args:
+        questions (tuple): Natural language questions
+        table_name (str): Name of the table to query
+        table_info (str): Information about the table schema
+        
+    Returns:
+        list: Generated SQL queries, one per question
+    """
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+    response = get_chain(BATCH_SQL_GENERATION_TEMPLATE).invoke({
+        "questions": numbered,
+        "table_name": table_name,
+        "table_info": table_info
+    })
+    
+    return extract_sql_queries_from_response(response, len(questions))
 
 def extract_sql_from_response(response):
     """
@@ -71,18 +120,37 @@ def extract_sql_from_response(response):
     Returns:
         str: Extracted SQL query
     """
-    # Check if the response contains SQL code blocks
-    if "```sql" in response:
-        # Extract SQL from code blocks
-        parts = response.split("```sql")
-        if len(parts) > 1:
-            sql_part = parts[1].split("```")[0].strip()
-            return sql_part
-    
-    # If no code blocks, check for SELECT keyword
-    if "SELECT" in response.upper() or "select" in response.lower():
-        # Assume the whole response is the SQL query
-        return response.strip()
+    # Prefer a fenced code block anywhere in the response
+    match = _SQL_CODE_BLOCK.search(response)
+    
+    # Otherwise take everything from the first line that starts a statement
+    if match is None:
+        match = _SQL_STATEMENT.search(response)
     
     # Fallback: return the entire response
-    return response.strip()
+    return (match.group(1) if match else response).strip()
+
+def extract_sql_queries_from_response(response, count):
+    """
+    Split a batched LLM response into one SQL query per question
+    
+    Args:
+        response (str): LLM response with "-- Q<n>:" markers
+        count (int): Number of questions that were asked
+        
+    Returns:
+        list: Extracted SQL queries; empty strings for unanswered questions
+    """
+    # Drop code fences first so a single fence around the whole batch doesn't
+    # leave its closing ``` on the last query
+    response = _CODE_FENCE.sub("", response)
+    
+    queries = [""] * count
+    markers = list(_QUESTION_MARKER.finditer(response))
+    for marker, next_marker in zip(markers, markers[1:] + [None]):
+        index = int(marker.group(1)) - 1
+        end = next_marker.start() if next_marker else len(response)
+        if 0 <= index < count:
+            queries[index] = extract_sql_from_response(response[marker.end():end])
+    
+    return queries
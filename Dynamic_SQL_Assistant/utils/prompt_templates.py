@@ -24,4 +24,31 @@ IMPORTANT GUIDELINES:
 SQL QUERY:
 """
 
+# Batched variant: several numbered questions answered in a single request
+BATCH_SQL_GENERATION_TEMPLATE = """
+You are an expert SQL query generator. Your task is to convert each of the numbered natural language questions below into a valid SQLite SQL query.
+
+TABLE INFORMATION:
+Table name: {table_name}
+Columns:
+{table_info}
+
+USER QUESTIONS:
+{questions}
+
+IMPORTANT GUIDELINES:
+1. For each question, write a line "-- Q<number>:" followed by its SQL query, in the same order as the questions.
+2. Generate ONLY the SQL queries without any explanations or markdown.
+3. Ensure each query is valid SQLite syntax.
+4. Use the exact column names as provided in the table information.
+5. Handle case sensitivity appropriately in column names.
+6. For string comparisons, use appropriate wildcards (%) and LIKE operator when needed.
+7. When appropriate, use aggregation functions (COUNT, SUM, AVG, etc.)
+8. If a question asks for a specific number of results, use LIMIT.
+9. Ensure proper use of GROUP BY, ORDER BY, and WHERE clauses as needed.
+10. Do not use features not supported by SQLite.
+
+SQL QUERIES:
+"""
+
 # You can add more prompt templates for different purposes here